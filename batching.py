@@ -0,0 +1,84 @@
+import asyncio
+from typing import Awaitable, Callable, List
+
+
+class AsyncBatcher:
+    """
+    Coalesce concurrent single-item calls into batched calls.
+
+    Items already queued are passed to batch_fn together (up to max_batch),
+    and each caller receives its own result. A lone item is flushed at once;
+    when several are pending, the worker waits up to max_wait_ms for more.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], Awaitable[List]], max_batch: int = 64, max_wait_ms: int = 10):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._loop = None
+        self._worker = None
+
+    def start(self):
+        """Start the background worker on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+
+    async def submit(self, item):
+        """Queue an item and wait for its result"""
+        self.start()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def serves_other_threads(self) -> bool:
+        """Whether the calling thread can block on submit_threadsafe"""
+        if self._loop is None or not self._loop.is_running():
+            return False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+        # Blocking inside an event loop would stall it
+        return False
+
+    def submit_threadsafe(self, item):
+        """Submit from a worker thread and block until its result is ready"""
+        return asyncio.run_coroutine_threadsafe(self.submit(item), self._loop).result()
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            # Only pay the wait under load, when batching is actually happening
+            if len(batch) > 1:
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+            items = [item for item, _ in batch]
+            try:
+                results = list(await self.batch_fn(items))
+                if len(results) != len(items):
+                    raise ValueError(f"batch_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
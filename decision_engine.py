@@ -1,26 +1,23 @@
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_google_genai import ChatGoogleGenerativeAI
-from retriever import retrieve_clauses  # Import from your updated retriever
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+from prompt_cache import SystemPrompt
+from retriever import retrieve_clauses, aretrieve_clauses  # Import from your updated retriever
 from query_parser import parse_insurance_query  # Import query parser
+import asyncio
 import json
-import re
-from typing import Dict, Optional
+from typing import Dict, List, Literal, Optional
 
-# Initialize Gemini LLM (consistent with your architecture)
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",
-    temperature=0.1,  # Lower temperature for consistent decisions
-    convert_system_message_to_human=True
-)
 
-class InsuranceDecisionEngine:
-    """
-    Insurance claims adjudication system using RAG-retrieved policy clauses
-    """
-    
-    def __init__(self):
-        self.decision_prompt = PromptTemplate.from_template("""
+class DecisionSchema(BaseModel):
+    """Structured claim decision returned by Gemini"""
+    decision: Literal["APPROVED", "REJECTED"]
+    amount: Optional[int] = None
+    justification: str
+    risk_factors: List[str] = []
+    coverage_status: Literal["full", "partial", "none"]
+
+# Static adjudication instructions, sent ahead of each claim's details
+DECISION_INSTRUCTION = """
 You are an expert insurance claims adjudication system.
 
 Based on the policy clauses and patient details, determine:
@@ -28,16 +25,6 @@ Based on the policy clauses and patient details, determine:
 - If approved, suggest a payout amount (default ₹50,000 for standard surgery)
 - Provide justification citing exact phrases from the clauses
 
-### Policy Clauses:
-{clauses}
-
-### Patient Details:
-- Age: {age}
-- Gender: {gender}  
-- Procedure: {procedure}
-- Location: {location}
-- Policy Duration (months): {duration}
-
 ### Decision Rules:
 - Policies under 24 months do NOT cover knee/joint replacement surgeries
 - Only emergency orthopedic care is allowed before 24 months
@@ -46,17 +33,96 @@ Based on the policy clauses and patient details, determine:
 - Location-based treatment costs vary
 
 Return response in strict JSON format:
-{{
+{
     "decision": "APPROVED" or "REJECTED",
     "amount": number or null,
     "justification": "detailed explanation with clause references",
     "risk_factors": ["list of identified risk factors"],
     "coverage_status": "full/partial/none"
-}}
+}"""
+
+# Decisions in flight at once across all batches, to stay under Gemini's rate limit
+MAX_CONCURRENT_DECISIONS = 8
+
+# Initialize Gemini LLM (consistent with your architecture)
+decision_system_prompt = SystemPrompt(
+    DECISION_INSTRUCTION,
+    temperature=0.1  # Lower temperature for consistent decisions
+)
+
+class InsuranceDecisionEngine:
+    """
+    Insurance claims adjudication system using RAG-retrieved policy clauses
+    """
+    
+    def __init__(self):
+        # Only the per-claim details are sent with each request
+        self.decision_prompt = ChatPromptTemplate.from_template("""
+### Policy Clauses:
+{clauses}
+
+### Patient Details:
+- Age: {age}
+- Gender: {gender}  
+- Procedure: {procedure}
+- Location: {location}
+- Policy Duration (months): {duration}
 
 JSON Response:""")
         
-        self.decision_chain = LLMChain(llm=llm, prompt=self.decision_prompt)
+        self.decision_chain = self.decision_prompt | decision_system_prompt.as_runnable(DecisionSchema)
+        
+        # Shared by every batch so concurrent requests don't multiply the limit
+        self.decision_slots = asyncio.Semaphore(MAX_CONCURRENT_DECISIONS)
+    
+    def _patient_data_from_query(self, parsed_query: Dict) -> Dict:
+        """Extract patient details from a parsed query"""
+        if "error" in parsed_query:
+            # Surface as a system error rather than deciding on null details
+            raise RuntimeError(f"Query parsing failed: {parsed_query['error']}")
+        return {
+            "age": parsed_query.get("age", "Unknown"),
+            "gender": parsed_query.get("gender", "Unknown"),
+            "procedure": parsed_query.get("procedure", "Unknown"),
+            "location": parsed_query.get("location", "Unknown"),
+            "duration": parsed_query.get("policy_duration_months", "Unknown")
+        }
+    
+    def _chain_inputs(self, clauses: tuple, patient_data: Dict) -> Dict:
+        """Build decision prompt inputs from clauses and patient details"""
+        return {
+            "clauses": "\n\n".join(clauses),
+            "age": patient_data["age"],
+            "gender": patient_data["gender"],
+            "procedure": patient_data["procedure"],
+            "location": patient_data["location"],
+            "duration": patient_data["duration"]
+        }
+    
+    def _build_decision(self, decision: DecisionSchema, query: str, patient_data: Dict, clauses: tuple) -> Dict:
+        """Attach request metadata to the structured decision"""
+        decision_data = decision.model_dump()
+        
+        # Add metadata
+        decision_data["patient_details"] = patient_data
+        decision_data["query"] = query
+        decision_data["clauses_count"] = len(clauses)
+        
+        return decision_data
+    
+    def _error_decision(self, query: str, patient_data: Optional[Dict], e: Exception) -> Dict:
+        """Rejection response for unexpected failures"""
+        print(f"Error in decision making: {e}")
+        return {
+            "decision": "REJECTED",
+            "amount": None,
+            "justification": f"System error: {str(e)}",
+            "risk_factors": ["System error"],
+            "coverage_status": "none",
+            "patient_details": patient_data or {},
+            "query": query,
+            "error": str(e)
+        }
     
     def make_decision(self, query: str, patient_data: Optional[Dict] = None) -> Dict:
         """
@@ -65,69 +131,47 @@ JSON Response:""")
         try:
             # Parse query to extract patient details if not provided
             if not patient_data:
-                parsed_query = parse_insurance_query(query)
-                patient_data = {
-                    "age": parsed_query.get("age", "Unknown"),
-                    "gender": parsed_query.get("gender", "Unknown"),
-                    "procedure": parsed_query.get("procedure", "Unknown"),
-                    "location": parsed_query.get("location", "Unknown"),
-                    "duration": parsed_query.get("policy_duration_months", "Unknown")
-                }
+                patient_data = self._patient_data_from_query(parse_insurance_query(query))
             
             # Retrieve relevant policy clauses
-            clauses_text = "\n\n".join(retrieve_clauses(query))
+            clauses = retrieve_clauses(query)
             
             # Generate decision
-            decision_result = self.decision_chain.run(
-                clauses=clauses_text,
-                age=patient_data["age"],
-                gender=patient_data["gender"],
-                procedure=patient_data["procedure"],
-                location=patient_data["location"],
-                duration=patient_data["duration"]
-            )
+            decision = self.decision_chain.invoke(self._chain_inputs(clauses, patient_data))
+            
+            return self._build_decision(decision, query, patient_data, clauses)
+            
+        except Exception as e:
+            return self._error_decision(query, patient_data, e)
+    
+    async def amake_decision(self, query: str, patient_data: Optional[Dict] = None) -> Dict:
+        """
+        Async variant of make_decision
+        """
+        try:
+            # Parse query to extract patient details if not provided
+            if not patient_data:
+                parsed_query = await asyncio.to_thread(parse_insurance_query, query)
+                patient_data = self._patient_data_from_query(parsed_query)
             
-            # Parse JSON response
-            json_match = re.search(r'\{.*\}', decision_result, re.DOTALL)
-            if json_match:
-                decision_data = json.loads(json_match.group())
-            else:
-                # Fallback response
-                decision_data = {
-                    "decision": "REJECTED",
-                    "amount": None,
-                    "justification": "Unable to process claim - insufficient policy information",
-                    "risk_factors": ["Processing error"],
-                    "coverage_status": "none"
-                }
+            # Retrieve relevant policy clauses
+            clauses = await aretrieve_clauses(query)
             
-            # Add metadata
-            decision_data["patient_details"] = patient_data
-            decision_data["query"] = query
-            decision_data["clauses_count"] = len(retrieve_clauses(query))
+            # Generate decision
+            decision = await self.decision_chain.ainvoke(self._chain_inputs(clauses, patient_data))
             
-            return decision_data
+            return self._build_decision(decision, query, patient_data, clauses)
             
         except Exception as e:
-            print(f"Error in decision making: {e}")
-            return {
-                "decision": "REJECTED",
-                "amount": None,
-                "justification": f"System error: {str(e)}",
-                "risk_factors": ["System error"],
-                "coverage_status": "none",
-                "patient_details": patient_data or {},
-                "query": query,
-                "error": str(e)
-            }
+            return self._error_decision(query, patient_data, e)
     
-    def batch_decisions(self, queries: list) -> list:
-        """Process multiple claims at once"""
-        results = []
-        for query in queries:
-            decision = self.make_decision(query)
-            results.append(decision)
-        return results
+    async def batch_decisions(self, queries: list) -> list:
+        """Process multiple claims concurrently, at most MAX_CONCURRENT_DECISIONS at a time"""
+        async def bounded_decision(query: str) -> Dict:
+            async with self.decision_slots:
+                return await self.amake_decision(query)
+        
+        return await asyncio.gather(*map(bounded_decision, queries))
     
     def get_decision_summary(self, decision: Dict) -> str:
         """Generate human-readable decision summary"""
@@ -144,6 +188,10 @@ def process_claim_decision(query: str, patient_data: Optional[Dict] = None) -> D
     """Main function to process insurance claim decisions"""
     return decision_engine.make_decision(query, patient_data)
 
+async def batch_claim_decisions(queries: list) -> list:
+    """Process several insurance claim decisions concurrently"""
+    return await decision_engine.batch_decisions(queries)
+
 def get_decision_summary(query: str, patient_data: Optional[Dict] = None) -> str:
     """Get human-readable decision summary"""
     decision = process_claim_decision(query, patient_data)
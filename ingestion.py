@@ -1,28 +1,47 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from langchain.docstore.document import Document
 from langchain.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredEmailLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+SPLIT_BATCH_SIZE = 50
+
+# Document loader per supported file extension
+LOADERS = {
+    ".pdf": PyPDFLoader,
+    ".docx": Docx2txtLoader,
+    ".eml": UnstructuredEmailLoader,
+}
+
+def _load_one(path: str) -> List[Document]:
+    """Load a single document, dispatching on file extension"""
+    loader_cls = LOADERS.get(os.path.splitext(path)[1].lower())
+    if loader_cls is None:
+        return []
+    return loader_cls(path).load()
+
+def _split(documents: List[Document]) -> List[Document]:
+    """Split a batch of documents into chunks for indexing"""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len,)
+    return text_splitter.split_documents(documents)
+
 def load_and_split_documents(file_paths: List[str]) -> List[Document]:
     """Load and split documents into chunks"""
     if not file_paths:
-        raise ValueError("No file paths provided"):
-    documents = []
+        raise ValueError("No file paths provided")
     for path in file_paths:
         if not os.path.exists(path):
             raise FileNotFoundError(f"File not found: {path}")
-        elif path.endswith(".pdf"):
-            loader = PyPDFLoader(path)
-        elif path.endswith(".docx"):
-            loader = Docx2txtLoader(path)
-        elif path.endswith(".eml"):
-            loader = UnstructuredEmailLoader(path)
-        else:
-            continue
-        docs = loader.load()
-        documents.extend(docs)
-
-    # Split into chunks for indexing
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len,)
-    return text_splitter.split_documents(documents)
+
+    with ProcessPoolExecutor() as executor:
+        # Files are independent, so parse them in parallel
+        documents = list(itertools.chain.from_iterable(executor.map(_load_one, file_paths)))
+
+        # Split into chunks for indexing, one batch of documents per worker task
+        batches = [documents[i:i + SPLIT_BATCH_SIZE] for i in range(0, len(documents), SPLIT_BATCH_SIZE)]
+        return list(itertools.chain.from_iterable(executor.map(_split, batches)))
 
 
 
@@ -2,9 +2,13 @@ from fastapi import FastAPI, Request, HTTPException
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 import os
+import json
+import asyncio
+from typing import List
 import google.generativeai as genai
 from config import get_settings
 from database import get_user_data, save_user_message
@@ -15,10 +19,12 @@ from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains import ConversationChain
 
 from Backend_vectorstore import vectorstore, query_vectorstore
-from Backend_vectorstore import query_vectorstore
+from Backend_vectorstore import aquery_vectorstore_batch, embed_batcher
 from query_parser import parse_insurance_query, get_search_terms
-from decision_engine import process_claim_decision
-from retriever import query_rag_system
+from decision_engine import process_claim_decision, batch_claim_decisions
+from retriever import astream_rag_answer, combine_docs_chain
+from semantic_cache import semantic_cached
+from utils import REQUEST_CACHE
 
 # ====================================
 # FASTAPI APPLICATION SETUP
@@ -40,6 +46,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_cache_middleware(request: Request, call_next):
+    """Give each request a fresh cache so parse/retrieve/embed results are reused within it"""
+    token = REQUEST_CACHE.set({})
+    try:
+        return await call_next(request)
+    finally:
+        REQUEST_CACHE.reset(token)
+
 # Initialize chatbot
 chatbot = QueryChatbot()
 
@@ -48,6 +63,8 @@ async def startup_event():
     """Startup event to validate configuration"""
     if not Config.GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY environment variable is required")
+    # Let retrieval running in worker threads join the query embedding batches
+    embed_batcher.start()
     print(f"🚀 Query.AI Chatbot started successfully!")
     print(f"📚 Ready to help businesses grow!")
 
@@ -85,6 +102,38 @@ async def chat_endpoint(chat_message: ChatMessage):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _stream_answer(question: str):
+    """Format streamed answer chunks as server-sent events"""
+    try:
+        async for chunk in astream_rag_answer(question):
+            yield f"data: {json.dumps(chunk)}\n\n"
+    except Exception as e:
+        print(f"Error in RAG stream: {e}")
+        yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+    yield "data: [DONE]\n\n"
+
+@app.post("/query", tags=["Query"])
+async def query_endpoint(question: str):
+    """Answer a policy question, streaming tokens as they are generated"""
+    return StreamingResponse(_stream_answer(question), media_type="text/event-stream")
+
+@app.post("/query-with-decision", tags=["Query"])
+async def query_with_decision_endpoint(question: str):
+    """Answer a policy question, with a claim decision when it is about a claim"""
+    try:
+        return await answer_with_decision(question)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+MAX_BATCH_CLAIMS = 50
+
+@app.post("/claim-decisions", tags=["Claims"])
+async def claim_decisions_endpoint(queries: List[str]):
+    """Adjudicate several insurance claims concurrently"""
+    if len(queries) > MAX_BATCH_CLAIMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_CLAIMS} claims per request")
+    return await batch_claim_decisions(queries)
+
 @app.get("/history/{user_id}", tags=["History"])
 async def get_chat_history(user_id: str):
     """Get conversation history for a specific user"""
@@ -123,26 +172,32 @@ async def health_check():
     }
 
 
-def query_rag_system(question: str):
+@semantic_cached(match_numbers=True)
+async def answer_from_search_phrases(question: str) -> str:
+    """Answer a question from clauses retrieved with its enhanced search phrases"""
     # Parse and enhance query
-    parsed_query = parse_insurance_query(question)
+    parsed_query = await asyncio.to_thread(parse_insurance_query, question)
     search_terms = parsed_query["enhanced_search_phrases"]
     
-    # Search using multiple enhanced terms
-    all_results = []
-    for term in search_terms[:3]:  # Use top 3 search phrases
-        results = query_vectorstore(term, k=2)
-        all_results.extend(results)
+    # Search using multiple enhanced terms (top 3 phrases, embedded in one call)
+    all_results = await aquery_vectorstore_batch(search_terms[:3], k=2)
     
-    # Remove duplicates and get top results
-    unique_docs = list({doc.page_content: doc for doc in all_results}.values())[:5]
+    # Remove duplicates by Milvus primary key and get top results
+    seen = {}
+    for doc in all_results:
+        seen.setdefault(doc.metadata["pk"], doc)
+    unique_docs = list(seen.values())[:5]
     
     # Generate context-aware answer
-    context = "\n".join([doc.page_content for doc in unique_docs])
+    return await combine_docs_chain.ainvoke({"context": unique_docs, "input": question})
+
+async def answer_with_decision(question: str) -> dict:
+    """Answer a question and, for claim questions, adjudicate the claim"""
+    rag_answer = await answer_from_search_phrases(question)
     
     # Get claim decision if query is about claims
-    if "claim" in query.lower() or "surgery" in query.lower():
-        decision = process_claim_decision(query)
+    if "claim" in question.lower() or "surgery" in question.lower():
+        decision = await asyncio.to_thread(process_claim_decision, question)
         return {
             "answer": rag_answer,
             "decision": decision,
@@ -1,24 +1,32 @@
-from langchain.prompts import PromptTemplate
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
-from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel, field_validator
+from prompt_cache import SystemPrompt
 import json
-import re
-from typing import Dict, Optional
-
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",
-    temperature=0.2,
-    convert_system_message_to_human=True
-)
-
-class QueryParser:
-    """Parse and structure healthcare insurance queries for RAG retrieval"""
-    
-    def __init__(self):
-        # Prompt to structure the query
-        self.structure_prompt = PromptTemplate.from_template("""
+from typing import Dict, List, Literal, Optional
+from utils import request_cached
+
+
+class ParsedQuerySchema(BaseModel):
+    """Structured insurance query returned by Gemini"""
+    age: Optional[int] = None
+    gender: Optional[Literal["M", "F"]] = None
+    procedure: Optional[str] = None
+    location: Optional[str] = None
+    policy_duration_months: Optional[int] = None
+    query_type: Literal["coverage", "exclusion", "claim", "premium", "general"] = "general"
+    keywords: List[str] = []
+    enhanced_search_phrases: List[str] = []
+
+    @field_validator("gender", mode="before")
+    @classmethod
+    def normalize_gender(cls, value):
+        """Map "male"/"Female"/etc. to M/F; anything unrecognized becomes null"""
+        if not isinstance(value, str):
+            return None
+        return {"m": "M", "male": "M", "f": "F", "female": "F"}.get(value.strip().lower())
+
+# Static extraction instructions, sent ahead of each query
+STRUCTURE_INSTRUCTION = """
 You are an expert healthcare insurance query analyzer. Extract structured information from the following query.
 
 Return ONLY valid JSON format with these fields:
@@ -29,50 +37,31 @@ Return ONLY valid JSON format with these fields:
 - policy_duration_months: integer or null
 - query_type: "coverage", "exclusion", "claim", "premium", or "general"
 - keywords: array of important terms for document retrieval
+- enhanced_search_phrases: array of 2-3 alternative search phrases that would help find relevant policy documents, focusing on:
+  1. Policy coverage terms
+  2. Medical procedure terminology
+  3. Exclusion clauses"""
 
+structure_system_prompt = SystemPrompt(STRUCTURE_INSTRUCTION, temperature=0.2)
+
+class QueryParser:
+    """Parse and structure healthcare insurance queries for RAG retrieval"""
+    
+    def __init__(self):
+        # Single prompt that structures the query and generates retrieval phrases;
+        # only the query itself is sent with each request
+        self.structure_prompt = ChatPromptTemplate.from_template("""
 Query: {query}
 
 JSON Output:""")
         
-        self.structure_chain = LLMChain(llm=llm, prompt=self.structure_prompt)
-        
-        # Query enhancement for better retrieval
-        self.enhancement_prompt = PromptTemplate.from_template("""
-Based on this structured insurance query data, generate 2-3 alternative search phrases that would help find relevant policy documents.
-
-Original Query: {original_query}
-Structured Data: {structured_data}
-
-Generate search phrases focusing on:
-1. Policy coverage terms
-2. Medical procedure terminology  
-3. Exclusion clauses
-
-Search Phrases:""")
-        
-        self.enhancement_chain = LLMChain(llm=llm, prompt=self.enhancement_prompt)
+        self.structure_chain = self.structure_prompt | structure_system_prompt.as_runnable(ParsedQuerySchema)
 
     def parse_query(self, query: str) -> Dict:
         """Parse query into structured format"""
         try:
             # Get structured output
-            structured_output = self.structure_chain.run(query=query)
-            
-            # Clean and parse JSON
-            json_match = re.search(r'\{.*\}', structured_output, re.DOTALL)
-            if json_match:
-                structured_data = json.loads(json_match.group())
-            else:
-                # Fallback structure
-                structured_data = {
-                    "age": None,
-                    "gender": None,
-                    "procedure": None,
-                    "location": None,
-                    "policy_duration_months": None,
-                    "query_type": "general",
-                    "keywords": [query]
-                }
+            structured_data = self.structure_chain.invoke({"query": query}).model_dump()
             
             # Add original query
             structured_data["original_query"] = query
@@ -89,37 +78,19 @@ Search Phrases:""")
                 "location": None,
                 "policy_duration_months": None,
                 "query_type": "general",
-                "keywords": [query]
+                "keywords": [query],
+                "enhanced_search_phrases": [],
+                "error": str(e)
             }
 
-    def enhance_for_retrieval(self, parsed_query: Dict) -> list:
-        """Generate enhanced search phrases for better document retrieval"""
-        try:
-            enhanced_output = self.enhancement_chain.run(
-                original_query=parsed_query["original_query"],
-                structured_data=json.dumps(parsed_query, indent=2)
-            )
-            
-            # Extract search phrases
-            phrases = [phrase.strip() for phrase in enhanced_output.split('\n') if phrase.strip()]
-            
-            # Combine with original keywords
-            all_phrases = parsed_query.get("keywords", []) + phrases
-            
-            return list(set(all_phrases))  # Remove duplicates
-            
-        except Exception as e:
-            print(f"Error enhancing query: {e}")
-            return parsed_query.get("keywords", [parsed_query["original_query"]])
-
     def process_query(self, query: str) -> Dict:
         """Complete query processing pipeline"""
-        # Parse query
+        # Parse query; search phrases come back in the same response
         structured_data = self.parse_query(query)
         
-        # Enhance for retrieval
-        enhanced_phrases = self.enhance_for_retrieval(structured_data)
-        structured_data["enhanced_search_phrases"] = enhanced_phrases
+        # Generated phrases first (callers search only the top few), then keywords
+        all_phrases = structured_data.get("enhanced_search_phrases", []) + structured_data.get("keywords", [])
+        structured_data["enhanced_search_phrases"] = list(dict.fromkeys(all_phrases)) or [query]
         
         return structured_data
 
@@ -127,6 +98,7 @@ Search Phrases:""")
 query_parser = QueryParser()
 
 # Utility functions for integration
+@request_cached
 def parse_insurance_query(query: str) -> Dict:
     """Main function to parse insurance queries"""
     return query_parser.process_query(query)
@@ -1,41 +1,46 @@
+import asyncio
+from functools import lru_cache
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
+from prompt_cache import SystemPrompt
 from Backend_vectorstore import vector_db  # Import your vector store
+from semantic_cache import SemanticCache
+from utils import normalize_query
 
-# Initialize Gemini model
-model = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",  # Updated to latest model
-    temperature=0.2,
-    convert_system_message_to_human=True
+# Initialize Gemini model with the static answering instructions
+answer_system_prompt = SystemPrompt("""
+You are a helpful insurance policy assistant. Answer the question based only on the provided context.
+
+Provide a clear, accurate answer based on the policy documents. If the information isn't in the context, say so.""",
+    temperature=0.2
 )
 
-# Create retriever with optimized parameters
+# MMR diversifies results so near-duplicate clauses don't crowd the prompt
+MMR_SEARCH_KWARGS = {
+    "k": 5,
+    "fetch_k": 20,
+    "lambda_mult": 0.5
+}
+
+# Create retriever with optimized parameters (used by rag_chain)
 retriever = vector_db.as_retriever(
-    search_type="similarity",
-    search_kwargs={
-        "k": 5,
-        "score_threshold": 0.7  # Filter low-relevance results
-    }
+    search_type="mmr",
+    search_kwargs=MMR_SEARCH_KWARGS
 )
 
 # Define prompt template for document synthesis
 prompt_template = ChatPromptTemplate.from_template("""
-You are a helpful insurance policy assistant. Answer the question based only on the provided context.
-
 Context:
 {context}
 
 Question: {input}
 
-Provide a clear, accurate answer based on the policy documents. If the information isn't in the context, say so.
-
 Answer:""")
 
 # Create document combination chain
 combine_docs_chain = create_stuff_documents_chain(
-    llm=model,
+    llm=answer_system_prompt.as_runnable(),
     prompt=prompt_template
 )
 
@@ -45,16 +50,55 @@ rag_chain = create_retrieval_chain(
     combine_docs_chain=combine_docs_chain
 )
 
-def retrieve_clauses(query: str) -> list:
-    """Retrieve relevant document chunks for a query"""
-    relevant_docs = retriever.get_relevant_documents(query)
-    return [doc.page_content for doc in relevant_docs]
+# Previously generated answers, replayed for near-identical questions
+answer_cache = SemanticCache("retriever.answer", match_numbers=True)
+
+@lru_cache(maxsize=1024)
+def _retrieve_clauses(normalized_query: str) -> tuple:
+    # Query the vector store directly, skipping the retriever's callback machinery
+    relevant_docs = vector_db.max_marginal_relevance_search(normalized_query, **MMR_SEARCH_KWARGS)
+    return tuple(doc.page_content for doc in relevant_docs)
 
-def query_rag_system(query: str) -> str:
+def clear_clause_cache():
+    """Forget cached clause retrievals, e.g. after the collection is re-indexed"""
+    _retrieve_clauses.cache_clear()
+
+def retrieve_clauses(query: str) -> tuple:
+    """Retrieve relevant document chunks for a query (cached per normalized query)"""
+    return _retrieve_clauses(normalize_query(query))
+
+async def aretrieve_clauses(query: str) -> tuple:
+    """Async variant of retrieve_clauses, sharing its cache"""
+    return await asyncio.to_thread(retrieve_clauses, query)
+
+async def astream_rag_answer(query: str):
+    """Yield answer text chunks as Gemini generates them; a cached answer arrives as one chunk"""
+    try:
+        vector, cached = await asyncio.to_thread(answer_cache.lookup, query)
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {e}")
+        vector, cached = None, None
+    if cached is not None:
+        yield cached
+        return
+    
+    chunks = []
+    async for chunk in rag_chain.astream({"input": query}):
+        if "answer" in chunk:
+            chunks.append(chunk["answer"])
+            yield chunk["answer"]
+    
+    # Only complete answers reach here; failed or abandoned streams are not cached
+    if vector is not None:
+        try:
+            await asyncio.to_thread(answer_cache.store, query, vector, "".join(chunks))
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+
+async def query_rag_system(query: str) -> str:
     """Complete RAG query processing"""
     try:
-        response = rag_chain.invoke({"input": query})
-        return response["answer"]
+        return "".join([chunk async for chunk in astream_rag_answer(query)])
     except Exception as e:
         print(f"Error in RAG query: {e}")
         return "Sorry, I couldn't process your query. Please try again."
@@ -77,7 +121,7 @@ if __name__ == "__main__":
     print(f"Found {len(relevant_docs)} relevant documents")
     
     # Test full RAG
-    answer = query_rag_system(test_query)
+    answer = asyncio.run(query_rag_system(test_query))
     print(f"Answer: {answer}")
 
 
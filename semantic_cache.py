@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import inspect
+import json
+import re
+import time
+from langchain_milvus import Milvus
+from Backend_vectorstore import query_embeddings, check_collection_dim, milvus_uri, index_params, search_params  # Reuse the RAG embedding model and database
+from utils import normalize_query, query_arg_splitter, request_cached
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+# Separate collection holding previously answered queries
+check_collection_dim("query_cache")
+cache_db = Milvus(
+    embedding_function=query_embeddings,
+    connection_args={"uri": milvus_uri},
+    collection_name="query_cache",
+    auto_id=True,
+    index_params=index_params,
+    search_params=search_params,
+    drop_old=False
+)
+
+
+@request_cached
+def _embed_query(normalized_query: str) -> list:
+    """Embed a cache key; shared by every cached step of one request"""
+    return query_embeddings.embed_query(normalized_query)
+
+
+class SemanticCache:
+    """Embedding-keyed response cache for expensive Gemini pipelines"""
+
+    def __init__(self, namespace: str, threshold: float = 0.95, ttl: int = 3600, match_numbers: bool = False):
+        self.namespace = namespace
+        self.threshold = threshold
+        self.ttl = ttl
+        self.match_numbers = match_numbers
+
+    def lookup(self, query: str):
+        """Return (embedding, cached response or None) for a query"""
+        normalized = normalize_query(query)
+        vector = _embed_query(normalized)
+        expr = f'namespace == "{self.namespace}" and ts >= {time.time() - self.ttl}'
+        hits = cache_db.similarity_search_with_score_by_vector(vector, k=1, expr=expr)
+
+        # COSINE scores are similarities, higher is closer
+        if not hits or hits[0][1] < self.threshold:
+            return vector, None
+
+        # Embeddings barely separate "3 month" from "30 month"; require the
+        # same ages, durations and amounts when they decide the answer
+        document = hits[0][0]
+        if self.match_numbers and _NUMBER_RE.findall(document.page_content) != _NUMBER_RE.findall(normalized):
+            return vector, None
+        return vector, json.loads(document.metadata["response_json"])
+
+    def store(self, query: str, vector: list, response) -> None:
+        """Store a response under the query embedding and drop this namespace's expired entries"""
+        cache_db.add_embeddings(
+            texts=[normalize_query(query)],
+            embeddings=[vector],
+            metadatas=[{
+                "namespace": self.namespace,
+                "response_json": json.dumps(response),
+                "ts": time.time()
+            }]
+        )
+        cache_db.delete(expr=f'namespace == "{self.namespace}" and ts < {time.time() - self.ttl}')
+
+
+def semantic_cached(threshold: float = 0.95, ttl: int = 3600, match_numbers: bool = False):
+    """
+    Cache a function's result keyed on the embedding of its query argument.
+
+    The query is the first positional argument (after self for methods). Calls
+    that pass any further non-None arguments bypass the cache, since the result
+    then depends on more than the query text. Results containing an "error" key
+    are never stored.
+
+    Intended for free-text answers. Results that depend on exact parsed fields
+    (gender, procedure, location) must not be cached this way: embeddings barely
+    separate those. With match_numbers, a hit is only used when its query
+    contains exactly the same numbers as the incoming one.
+    """
+    def decorator(func):
+        cache = SemanticCache(f"{func.__module__}.{func.__qualname__}", threshold, ttl, match_numbers)
+        split_args = query_arg_splitter(func)
+
+        def should_store(result) -> bool:
+            return not (isinstance(result, dict) and "error" in result)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                query, cacheable = split_args(args, kwargs)
+                if not cacheable:
+                    return await func(*args, **kwargs)
+                try:
+                    vector, cached = await asyncio.to_thread(cache.lookup, query)
+                except Exception as e:
+                    print(f"Semantic cache lookup failed: {e}")
+                    return await func(*args, **kwargs)
+                if cached is not None:
+                    return cached
+
+                result = await func(*args, **kwargs)
+                if should_store(result):
+                    try:
+                        await asyncio.to_thread(cache.store, query, vector, result)
+                    except Exception as e:
+                        print(f"Semantic cache store failed: {e}")
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            query, cacheable = split_args(args, kwargs)
+            if not cacheable:
+                return func(*args, **kwargs)
+            try:
+                vector, cached = cache.lookup(query)
+            except Exception as e:
+                print(f"Semantic cache lookup failed: {e}")
+                return func(*args, **kwargs)
+            if cached is not None:
+                return cached
+
+            result = func(*args, **kwargs)
+            if should_store(result):
+                try:
+                    cache.store(query, vector, result)
+                except Exception as e:
+                    print(f"Semantic cache store failed: {e}")
+            return result
+        return wrapper
+    return decorator
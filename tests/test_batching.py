@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import AsyncBatcher
+
+
+class AsyncBatcherTest(unittest.TestCase):
+
+    def test_concurrent_items_are_batched(self):
+        calls = []
+
+        async def double(items):
+            calls.append(list(items))
+            return [item * 2 for item in items]
+
+        async def run():
+            batcher = AsyncBatcher(double, max_batch=3, max_wait_ms=10)
+            return await asyncio.gather(*[batcher.submit(i) for i in range(5)])
+
+        self.assertEqual(asyncio.run(run()), [0, 2, 4, 6, 8])
+        self.assertEqual(calls, [[0, 1, 2], [3, 4]])
+
+    def test_lone_item_is_not_delayed(self):
+        async def identity(items):
+            return items
+
+        async def run():
+            batcher = AsyncBatcher(identity, max_wait_ms=1000)
+            return await asyncio.wait_for(batcher.submit("q"), timeout=0.5)
+
+        self.assertEqual(asyncio.run(run()), "q")
+
+    def test_short_result_fails_every_caller(self):
+        async def drop_last(items):
+            return items[:-1]
+
+        async def run():
+            batcher = AsyncBatcher(drop_last, max_wait_ms=10)
+            return await asyncio.wait_for(
+                asyncio.gather(*[batcher.submit(i) for i in range(3)], return_exceptions=True),
+                timeout=1
+            )
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_batch_error_propagates(self):
+        async def fail(items):
+            raise RuntimeError("embedding backend down")
+
+        async def run():
+            batcher = AsyncBatcher(fail)
+            await batcher.submit(1)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run())
+
+    def test_worker_threads_join_loop_batches(self):
+        calls = []
+
+        async def double(items):
+            calls.append(sorted(items))
+            return [item * 2 for item in items]
+
+        async def run():
+            batcher = AsyncBatcher(double, max_wait_ms=50)
+            batcher.start()
+            self.assertFalse(batcher.serves_other_threads())
+
+            def from_thread(item):
+                self.assertTrue(batcher.serves_other_threads())
+                return batcher.submit_threadsafe(item)
+
+            return await asyncio.gather(batcher.submit(1), asyncio.to_thread(from_thread, 2))
+
+        self.assertEqual(asyncio.run(run()), [2, 4])
+        self.assertEqual(sum(len(call) for call in calls), 2)
+
+    def test_no_thread_submissions_without_a_running_loop(self):
+        async def identity(items):
+            return items
+
+        self.assertFalse(AsyncBatcher(identity).serves_other_threads())
+
+
+if __name__ == "__main__":
+    unittest.main()
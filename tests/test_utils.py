@@ -0,0 +1,115 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import REQUEST_CACHE, normalize_query, query_arg_splitter, request_cached
+
+
+class NormalizeQueryTest(unittest.TestCase):
+
+    def test_example_query(self):
+        self.assertEqual(normalize_query("  46-year-old male, knee op?  "), "46 year old male, knee surgery")
+
+    def test_hyphens_between_words_are_split(self):
+        self.assertEqual(normalize_query("3-month policy"), "3 month policy")
+
+    def test_leading_and_spaced_hyphens_are_kept(self):
+        self.assertEqual(normalize_query("-5 - 3"), "-5 - 3")
+
+    def test_trailing_punctuation_is_stripped(self):
+        self.assertEqual(normalize_query("Is dental covered?!. "), "is dental covered")
+
+    def test_inner_punctuation_is_kept(self):
+        self.assertEqual(normalize_query("Pune, India"), "pune, india")
+
+    def test_synonyms_are_mapped(self):
+        self.assertEqual(normalize_query("2 yrs after operation"), "2 year after surgery")
+        self.assertEqual(normalize_query("6 mos"), "6 month")
+
+    def test_whitespace_is_collapsed(self):
+        self.assertEqual(normalize_query("knee   \t surgery"), "knee surgery")
+
+
+class RequestCachedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        @request_cached
+        def parse(query):
+            self.calls.append(query)
+            return {"query": query}
+
+        self.parse = parse
+
+    def test_outside_a_request_every_call_runs(self):
+        self.parse("knee surgery")
+        self.parse("knee surgery")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_inside_a_request_normalized_repeats_are_reused(self):
+        token = REQUEST_CACHE.set({})
+        try:
+            first = self.parse("Knee op?")
+            second = self.parse("knee surgery")
+        finally:
+            REQUEST_CACHE.reset(token)
+
+        self.assertEqual(self.calls, ["Knee op?"])
+        self.assertIs(first, second)
+
+    def test_requests_do_not_share_results(self):
+        for _ in range(2):
+            token = REQUEST_CACHE.set({})
+            try:
+                self.parse("knee surgery")
+            finally:
+                REQUEST_CACHE.reset(token)
+        self.assertEqual(len(self.calls), 2)
+
+
+def lookup(query, k=None):
+    return query
+
+
+class DecisionEngine:
+
+    def make_decision(self, query, patient_data=None):
+        return query
+
+
+class QueryArgSplitterTest(unittest.TestCase):
+
+    def test_function_query_is_first_argument(self):
+        split = query_arg_splitter(lookup)
+        self.assertEqual(split(("knee surgery",), {}), ("knee surgery", True))
+
+    def test_method_query_follows_self(self):
+        split = query_arg_splitter(DecisionEngine.make_decision)
+        engine = DecisionEngine()
+        self.assertEqual(split((engine, "knee surgery"), {}), ("knee surgery", True))
+
+    def test_none_extras_stay_cacheable(self):
+        split = query_arg_splitter(DecisionEngine.make_decision)
+        engine = DecisionEngine()
+        self.assertEqual(split((engine, "knee surgery", None), {}), ("knee surgery", True))
+        self.assertEqual(split((engine, "knee surgery"), {"patient_data": None}), ("knee surgery", True))
+
+    def test_patient_data_bypasses_cache(self):
+        split = query_arg_splitter(DecisionEngine.make_decision)
+        engine = DecisionEngine()
+        patient_data = {"age": 46, "gender": "M"}
+        self.assertFalse(split((engine, "knee surgery", patient_data), {})[1])
+        self.assertFalse(split((engine, "knee surgery"), {"patient_data": patient_data})[1])
+
+    def test_missing_or_non_string_query_bypasses_cache(self):
+        split = query_arg_splitter(lookup)
+        self.assertEqual(split((), {}), (None, False))
+        self.assertFalse(split((42,), {})[1])
+        self.assertFalse(split((), {"query": "knee surgery"})[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import functools
+import inspect
+import re
+from contextvars import ContextVar
+from typing import Optional
+
+_HYPHEN_RE = re.compile(r"(?<=\w)-(?=\w)")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!,;:]+$")
+
+# Shorthand mapped to the form used in policy documents
+_SYNONYMS = {
+    "op": "surgery",
+    "operation": "surgery",
+    "yr": "year",
+    "yrs": "year",
+    "years": "year",
+    "mo": "month",
+    "mos": "month",
+    "months": "month",
+}
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a query for cache keys and embeddings,
+    e.g. "46-year-old male, knee op?" -> "46 year old male, knee surgery"
+    """
+    query = _HYPHEN_RE.sub(" ", query.lower().strip())
+    query = _TRAILING_PUNCT_RE.sub("", query)
+    return " ".join(_SYNONYMS.get(word, word) for word in query.split())
+
+
+# Per-request memo of parse/retrieve/embed results; None outside a request
+REQUEST_CACHE: ContextVar[Optional[dict]] = ContextVar("request_cache", default=None)
+
+def request_cached(func):
+    """Memoize a single-query function for the lifetime of the current request"""
+    @functools.wraps(func)
+    def wrapper(query: str):
+        cache = REQUEST_CACHE.get()
+        if cache is None:
+            return func(query)
+        key = (func.__qualname__, normalize_query(query))
+        if key not in cache:
+            cache[key] = func(query)
+        return cache[key]
+    return wrapper
+
+
+def query_arg_splitter(func):
+    """
+    Build a function mapping a call's (args, kwargs) to (query, cacheable).
+
+    The query is the first positional argument (after self for methods). The
+    call is only cacheable when the query is a string and every other argument
+    is None, since the result then depends on the query text alone.
+    """
+    query_index = 1 if "self" in inspect.signature(func).parameters else 0
+
+    def split(args, kwargs):
+        query = args[query_index] if len(args) > query_index else None
+        extra = list(args[query_index + 1:]) + list(kwargs.values())
+        cacheable = isinstance(query, str) and all(value is None for value in extra)
+        return query, cacheable
+    return split
@@ -1,47 +1,134 @@
+import asyncio
 import getpass
 import os
 import tempfile
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_milvus import Milvus
+from pymilvus import MilvusClient
+from batching import AsyncBatcher
 
 
 # Setup Google API Key
 if not os.environ.get("GOOGLE_API_KEY"):
     os.environ["GOOGLE_API_KEY"] = getpass.getpass("Enter API key for Google Gemini: ")
 
-# Initialize Gemini Embedding Model
-embedding_model = GoogleGenerativeAIEmbeddings(
-    model="models/gemini-embedding-001",
-    task_type="retrieval_document"  # Optimized for document retrieval
+# Chunks embedded per forward pass and inserted per Milvus write
+EMBED_BATCH_SIZE = 64
+
+# Output size of bge-small-en-v1.5
+EMBED_DIM = 384
+
+# bge retrieval expects this prefix on queries (not on passages)
+BGE_QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+
+# Initialize local embedding model (no network round-trip per query)
+embedding_model = HuggingFaceEmbeddings(
+    model_name="BAAI/bge-small-en-v1.5",
+    model_kwargs={"device": "cpu"},
+    encode_kwargs={"batch_size": EMBED_BATCH_SIZE, "normalize_embeddings": True},
+    query_encode_kwargs={"prompt": BGE_QUERY_INSTRUCTION, "batch_size": EMBED_BATCH_SIZE, "normalize_embeddings": True}
 )
 
-# Create temporary database file
-db_file = tempfile.NamedTemporaryFile(prefix="milvus_", suffix=".db", delete=False).name
-print(f"The vector database will be saved to {db_file}")
+def embed_queries(queries: list) -> list:
+    """Embed several queries in one call, with the bge query instruction"""
+    return embedding_model.embed_documents([BGE_QUERY_INSTRUCTION + query for query in queries])
+
+async def aembed_queries(queries: list) -> list:
+    """Async variant of embed_queries"""
+    return await embedding_model.aembed_documents([BGE_QUERY_INSTRUCTION + query for query in queries])
+
+# Coalesce concurrent query embeddings into one batched call
+embed_batcher = AsyncBatcher(aembed_queries, max_batch=EMBED_BATCH_SIZE, max_wait_ms=10)
+
+class BatchedQueryEmbeddings(Embeddings):
+    """
+    embedding_model with query embeddings routed through embed_batcher.
+
+    Sync calls from worker threads join the server loop's batches; without a
+    running server loop they embed directly.
+    """
+
+    def embed_documents(self, texts: list) -> list:
+        return embedding_model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        if embed_batcher.serves_other_threads():
+            return embed_batcher.submit_threadsafe(text)
+        return embed_queries([text])[0]
+
+    async def aembed_query(self, text: str) -> list:
+        return await embed_batcher.submit(text)
+
+# Milvus embeds search queries (similarity, MMR, retriever) through this
+query_embeddings = BatchedQueryEmbeddings()
+
+milvus_uri = os.environ.get("MILVUS_URI")
+if milvus_uri:
+    # Milvus server: HNSW graph index for log-scale search
+    index_params = {"index_type": "HNSW", "metric_type": "COSINE", "params": {"M": 16, "efConstruction": 200}}
+    search_params = {"metric_type": "COSINE", "params": {"ef": 64}}
+else:
+    # Create temporary database file
+    milvus_uri = tempfile.NamedTemporaryFile(prefix="milvus_", suffix=".db", delete=False).name
+    print(f"The vector database will be saved to {milvus_uri}")
+
+    # Milvus Lite only supports FLAT search and ignores other index types
+    index_params = {"index_type": "AUTOINDEX", "metric_type": "COSINE"}
+    search_params = None
+
+def check_collection_dim(collection_name: str):
+    """Fail fast if a collection on the Milvus server holds vectors of another size"""
+    # drop_old=False keeps existing collections, including ones built with an older embedding model
+    if not os.environ.get("MILVUS_URI"):
+        return
+    client = MilvusClient(uri=milvus_uri)
+    if not client.has_collection(collection_name):
+        return
+    for field in client.describe_collection(collection_name)["fields"]:
+        dim = field.get("params", {}).get("dim")
+        if dim is not None and int(dim) != EMBED_DIM:
+            raise RuntimeError(
+                f"Milvus collection '{collection_name}' stores {dim}-dim vectors but the embedding model "
+                f"produces {EMBED_DIM}; drop the collection and re-run setup_vectorstore()"
+            )
 
 # Initialize Milvus Vector Store
+check_collection_dim("RAG_Collection")
 vector_db = Milvus(
-    embedding_function=embedding_model,
-    connection_args={"uri": db_file},
+    embedding_function=query_embeddings,
+    connection_args={"uri": milvus_uri},
     collection_name="RAG_Collection",
     auto_id=True,
-    index_params={"index_type": "AUTOINDEX", "metric_type": "COSINE"},
+    index_params=index_params,
+    search_params=search_params,
     drop_old=False
 )
 
 
 def setup_vectorstore():
     """Initialize and populate the vector store"""
+    # Imported here so query-serving processes don't load the document parsers
+    from ingestion import load_and_split_documents
+    
     # Load and split documents
     file_paths = ["insurance_policy_v3.pdf", "exclusions_clause.docx"]
     docs = load_and_split_documents(file_paths)
     
     print(f"Loaded {len(docs)} document chunks")
     
-    # Add documents to Milvus
-    vector_db.add_documents(docs)
+    # Embed in batches and add documents to Milvus
+    for i in range(0, len(docs), EMBED_BATCH_SIZE):
+        batch = docs[i:i + EMBED_BATCH_SIZE]
+        texts = [doc.page_content for doc in batch]
+        embeddings = embedding_model.embed_documents(texts)
+        vector_db.add_embeddings(texts, embeddings, metadatas=[doc.metadata for doc in batch])
     print("Documents indexed successfully!")
     
+    # Imported here: retriever imports this module
+    from retriever import clear_clause_cache
+    clear_clause_cache()
+    
     return vector_db
 
 def query_vectorstore(query: str, k: int = 5):
@@ -49,6 +136,26 @@ def query_vectorstore(query: str, k: int = 5):
     results = vector_db.similarity_search(query, k=k)
     return results
 
+def query_vectorstore_batch(queries: list, k: int = 5):
+    """Query the vector store for several phrases with a single embedding call"""
+    vectors = embed_queries(queries)
+    results = []
+    for vector in vectors:
+        results.extend(vector_db.similarity_search_by_vector(vector, k=k))
+    return results
+
+async def aembed_query(query: str) -> list:
+    """Embed a query, batched with other queries arriving at the same time"""
+    return await query_embeddings.aembed_query(query)
+
+async def aquery_vectorstore_batch(queries: list, k: int = 5):
+    """Async variant of query_vectorstore_batch, searching all phrases concurrently"""
+    vectors = await asyncio.gather(*[aembed_query(query) for query in queries])
+    result_lists = await asyncio.gather(
+        *[vector_db.asimilarity_search_by_vector(vector, k=k) for vector in vectors]
+    )
+    return [doc for results in result_lists for doc in results]
+
 # Initialize the vectorstore
 if __name__ == "__main__":
     vectorstore = setup_vectorstore()